@@ -4580,7 +4580,7 @@ class JobLaunchSerializer(BaseSerializer):
     # Accepted on launch fields
     extra_vars = serializers.JSONField(required=False, write_only=True)
     inventory = serializers.PrimaryKeyRelatedField(queryset=Inventory.objects.all(), required=False, write_only=True)
-    credentials = serializers.PrimaryKeyRelatedField(many=True, queryset=Credential.objects.all(), required=False, write_only=True)
+    credentials = serializers.PrimaryKeyRelatedField(many=True, queryset=Credential.with_type(), required=False, write_only=True)
     credential_passwords = VerbatimField(required=False, write_only=True)
     scm_branch = serializers.CharField(required=False, write_only=True, allow_blank=True)
     diff_mode = serializers.BooleanField(required=False, write_only=True)
@@ -4735,7 +4735,7 @@ class JobLaunchSerializer(BaseSerializer):
             distinct_cred_kinds.append(cred.unique_hash())
 
         # Prohibit removing credentials from the JT list (unsupported for now)
-        template_credentials = template.credentials.all()
+        template_credentials = template.credentials.select_related('credential_type')
         if 'credentials' in attrs:
             removed_creds = set(template_credentials) - set(attrs['credentials'])
             provided_mapping = Credential.unique_dict(attrs['credentials'])
@@ -4969,7 +4969,7 @@ class BulkJobLaunchSerializer(serializers.Serializer):
         key_to_obj_map = {
             "unified_job_template": {obj.id: obj for obj in UnifiedJobTemplate.objects.filter(id__in=requested_ujts)},
             "inventory": {obj.id: obj for obj in Inventory.objects.filter(id__in=requested_use_inventories)},
-            "credentials": {obj.id: obj for obj in Credential.objects.filter(id__in=requested_use_credentials)},
+            "credentials": {obj.id: obj for obj in Credential.with_type().filter(id__in=requested_use_credentials)},
             "labels": {obj.id: obj for obj in Label.objects.filter(id__in=requested_use_labels)},
             "instance_groups": {obj.id: obj for obj in InstanceGroup.objects.filter(id__in=requested_use_instance_groups)},
             "execution_environment": {obj.id: obj for obj in ExecutionEnvironment.objects.filter(id__in=requested_use_execution_environments)},
@@ -2,14 +2,14 @@
 # All Rights Reserved.
 from contextlib import nullcontext
 import functools
+from importlib.metadata import entry_points
 import inspect
 import logging
 import os
-from pkg_resources import iter_entry_points
 import re
 import stat
 import tempfile
-from types import SimpleNamespace
+from types import MappingProxyType, SimpleNamespace
 
 # Jinja2
 from jinja2 import sandbox
@@ -21,7 +21,6 @@ from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError
 from django.conf import settings
-from django.utils.encoding import force_str
 from django.utils.functional import cached_property
 from django.utils.timezone import now
 from django.contrib.auth.models import User
@@ -39,7 +38,7 @@ from awx.main.fields import (
     CredentialTypeInjectorField,
     DynamicCredentialInputField,
 )
-from awx.main.utils import decrypt_field, classproperty, set_environ
+from awx.main.utils import decrypt_field, decrypt_fields, classproperty, set_environ
 from awx.main.utils.safe_yaml import safe_dump
 from awx.main.utils.execution_environments import to_container_path
 from awx.main.validators import validate_ssh_private_key
@@ -56,28 +55,44 @@ from awx_plugins.credentials import injectors as builtin_injectors
 __all__ = ['Credential', 'CredentialType', 'CredentialInputSource', 'build_safe_env']
 
 logger = logging.getLogger('awx.main.models.credential')
-credential_plugins = dict((ep.name, ep.load()) for ep in iter_entry_points('awx_plugins.credentials'))
+credential_plugin_entry_points = MappingProxyType({ep.name: ep for ep in entry_points(group='awx_plugins.credentials')})
 
 HIDDEN_PASSWORD = '**********'
 
+_HIDDEN_RE = re.compile(r'API|TOKEN|KEY|SECRET|PASS', re.I)
+_URLPASS_RE = re.compile(r'^.*?://[^:]+:(.*?)@.*?$')
+_ANSIBLE_ALLOW_PREFIXES = ('ANSIBLE_NET', 'ANSIBLE_GALAXY_SERVER')
+
+# shared by all injector renders; rendering does not mutate the environment
+_SANDBOX_ENV = sandbox.ImmutableSandboxedEnvironment()
+
+_BUILTIN_INJECTOR_NAMES = frozenset(name for name in dir(builtin_injectors) if not name.startswith('_'))
+
+
+@functools.lru_cache(maxsize=None)
+def get_credential_plugin(namespace):
+    return credential_plugin_entry_points[namespace].load()
+
 
 def build_safe_env(env):
     """
     Build environment dictionary, hiding potentially sensitive information
     such as passwords or keys.
     """
-    hidden_re = re.compile(r'API|TOKEN|KEY|SECRET|PASS', re.I)
-    urlpass_re = re.compile(r'^.*?://[^:]+:(.*?)@.*?$')
+    hidden_search = _HIDDEN_RE.search
+    urlpass_subn = _URLPASS_RE.subn
     safe_env = dict(env)
     for k, v in safe_env.items():
         if k == 'AWS_ACCESS_KEY_ID':
             continue
-        elif k.startswith('ANSIBLE_') and not k.startswith('ANSIBLE_NET') and not k.startswith('ANSIBLE_GALAXY_SERVER'):
+        elif k.startswith('ANSIBLE_') and not k.startswith(_ANSIBLE_ALLOW_PREFIXES):
             continue
-        elif hidden_re.search(k):
+        elif hidden_search(k):
             safe_env[k] = HIDDEN_PASSWORD
-        elif type(v) == str and urlpass_re.match(v):
-            safe_env[k] = urlpass_re.sub(HIDDEN_PASSWORD, v)
+        elif isinstance(v, str):
+            masked, count = urlpass_subn(HIDDEN_PASSWORD, v)
+            if count:
+                safe_env[k] = masked
     return safe_env
 
 
@@ -136,6 +151,10 @@ class Credential(PasswordFieldsModel, CommonModelNameNotUnique, ResourceMixin):
         ]
     )
 
+    @classmethod
+    def with_type(cls):
+        return cls.objects.select_related('credential_type')
+
     @property
     def kind(self):
         return self.credential_type.namespace
@@ -168,6 +187,11 @@ class Credential(PasswordFieldsModel, CommonModelNameNotUnique, ResourceMixin):
         except AttributeError:
             return False
 
+        # Only keys with an ENCRYPTED PEM type or header can be encrypted,
+        # except for the OpenSSH format, whose cipher is in the binary payload
+        if isinstance(ssh_key_data, str) and 'ENCRYPTED' not in ssh_key_data and 'OPENSSH' not in ssh_key_data:
+            return False
+
         try:
             pem_objects = validate_ssh_private_key(ssh_key_data)
             for pem_object in pem_objects:
@@ -205,11 +229,21 @@ class Credential(PasswordFieldsModel, CommonModelNameNotUnique, ResourceMixin):
         return needed
 
     @cached_property
-    def dynamic_input_fields(self):
+    def _input_sources_list(self):
+        # snapshot of the related input sources; refresh_from_db() drops it
         # if the credential is not yet saved we can't access the input_sources
         if not self.id:
             return []
-        return [obj.input_field_name for obj in self.input_sources.all()]
+        return list(self.input_sources.all())
+
+    @cached_property
+    def dynamic_input_fields(self):
+        return frozenset(obj.input_field_name for obj in self._input_sources_list)
+
+    def refresh_from_db(self, *args, **kwargs):
+        super(Credential, self).refresh_from_db(*args, **kwargs)
+        for attr in ('_input_sources_list', 'dynamic_input_fields'):
+            self.__dict__.pop(attr, None)
 
     def _password_field_allows_ask(self, field):
         return field in self.credential_type.askable_fields
@@ -217,11 +251,11 @@ class Credential(PasswordFieldsModel, CommonModelNameNotUnique, ResourceMixin):
     def save(self, *args, **kwargs):
         self.PASSWORD_FIELDS = self.credential_type.secret_fields
 
-        if self.pk:
-            cred_before = Credential.objects.get(pk=self.pk)
-            inputs_before = cred_before.inputs
+        if self.pk and any(v == '$encrypted$' for v in self.inputs.values()):
             # Look up the currently persisted value so that we can replace
-            # $encrypted$ with the actual DB-backed value
+            # $encrypted$ with the actual DB-backed value; only the inputs
+            # column is needed, and only when a placeholder is present
+            inputs_before = Credential.objects.filter(pk=self.pk).values_list('inputs', flat=True).get()
             for field in self.PASSWORD_FIELDS:
                 if self.inputs.get(field) == '$encrypted$':
                     self.inputs[field] = inputs_before[field]
@@ -244,7 +278,7 @@ class Credential(PasswordFieldsModel, CommonModelNameNotUnique, ResourceMixin):
     def display_inputs(self):
         field_val = self.inputs.copy()
         for k, v in field_val.items():
-            if force_str(v).startswith('$encrypted$'):
+            if isinstance(v, str) and v.startswith('$encrypted$'):
                 field_val[k] = '$encrypted$'
         return field_val
 
@@ -268,10 +302,9 @@ class Credential(PasswordFieldsModel, CommonModelNameNotUnique, ResourceMixin):
 
     @staticmethod
     def unique_dict(cred_qs):
-        ret = {}
-        for cred in cred_qs:
-            ret[cred.unique_hash()] = cred
-        return ret
+        if isinstance(cred_qs, models.QuerySet):
+            cred_qs = cred_qs.select_related('credential_type')
+        return {cred.unique_hash(): cred for cred in cred_qs}
 
     def get_input(self, field_name, **kwargs):
         """
@@ -291,9 +324,9 @@ class Credential(PasswordFieldsModel, CommonModelNameNotUnique, ResourceMixin):
             try:
                 return decrypt_field(self, field_name)
             except AttributeError:
-                for field in self.credential_type.inputs.get('fields', []):
-                    if field['id'] == field_name and 'default' in field:
-                        return field['default']
+                field = self.credential_type._fields_by_id.get(field_name)
+                if field and 'default' in field:
+                    return field['default']
                 if 'default' in kwargs:
                     return kwargs['default']
                 raise AttributeError(field_name)
@@ -301,9 +334,9 @@ class Credential(PasswordFieldsModel, CommonModelNameNotUnique, ResourceMixin):
             return self.inputs[field_name]
         if 'default' in kwargs:
             return kwargs['default']
-        for field in self.credential_type.inputs.get('fields', []):
-            if field['id'] == field_name and 'default' in field:
-                return field['default']
+        field = self.credential_type._fields_by_id.get(field_name)
+        if field and 'default' in field:
+            return field['default']
         raise AttributeError(field_name)
 
     def has_input(self, field_name):
@@ -318,7 +351,7 @@ class Credential(PasswordFieldsModel, CommonModelNameNotUnique, ResourceMixin):
         return True
 
     def _get_dynamic_input(self, field_name):
-        for input_source in self.input_sources.all():
+        for input_source in self._input_sources_list:
             if input_source.input_field_name == field_name:
                 return input_source.get_input_value()
         else:
@@ -389,35 +422,53 @@ class CredentialType(CommonModelNameNotUnique):
     def get_absolute_url(self, request=None):
         return reverse('api:credential_type_detail', kwargs={'pk': self.pk}, request=request)
 
-    @property
+    @cached_property
     def defined_fields(self):
-        return [field.get('id') for field in self.inputs.get('fields', [])]
+        return frozenset(field.get('id') for field in self.inputs.get('fields', []))
 
-    @property
+    @cached_property
     def secret_fields(self):
-        return [field['id'] for field in self.inputs.get('fields', []) if field.get('secret', False) is True]
+        return frozenset(field['id'] for field in self.inputs.get('fields', []) if field.get('secret', False) is True)
 
-    @property
+    @cached_property
     def askable_fields(self):
-        return [field['id'] for field in self.inputs.get('fields', []) if field.get('ask_at_runtime', False) is True]
+        return frozenset(field['id'] for field in self.inputs.get('fields', []) if field.get('ask_at_runtime', False) is True)
+
+    @cached_property
+    def _fields_by_id(self):
+        return {field['id']: field for field in self.inputs.get('fields', [])}
+
+    def _clear_inputs_cache(self):
+        for attr in ('defined_fields', 'secret_fields', 'askable_fields', '_fields_by_id'):
+            self.__dict__.pop(attr, None)
+
+    def save(self, *args, **kwargs):
+        super(CredentialType, self).save(*args, **kwargs)
+        self._clear_inputs_cache()
+
+    def refresh_from_db(self, *args, **kwargs):
+        super(CredentialType, self).refresh_from_db(*args, **kwargs)
+        self._clear_inputs_cache()
 
     @property
     def plugin(self):
         if self.kind != 'external':
             raise AttributeError('plugin')
-        [plugin] = [plugin for ns, plugin in credential_plugins.items() if ns == self.namespace]
-        return plugin
+        try:
+            return get_credential_plugin(self.namespace)
+        except KeyError:
+            raise AttributeError('plugin')
 
     def default_for_field(self, field_id):
-        for field in self.inputs.get('fields', []):
-            if field['id'] == field_id:
-                if 'choices' in field:
-                    return field['choices'][0]
-                return {'string': '', 'boolean': False}[field['type']]
+        field = self._fields_by_id.get(field_id)
+        if field is not None:
+            if 'choices' in field:
+                return field['choices'][0]
+            return {'string': '', 'boolean': False}[field['type']]
 
     @classproperty
     def defaults(cls):
-        return dict((k, functools.partial(v.create)) for k, v in ManagedCredentialType.registry.items())
+        return _get_defaults()
 
     @classmethod
     def _get_credential_type_class(cls, apps: Apps = None, app_config: AppConfig = None):
@@ -443,22 +494,34 @@ class CredentialType(CommonModelNameNotUnique):
     @classmethod
     def _setup_tower_managed_defaults(cls, apps: Apps = None, app_config: AppConfig = None):
         ct_class = cls._get_credential_type_class(apps=apps, app_config=app_config)
-        for default in ManagedCredentialType.registry.values():
-            existing = ct_class.objects.filter(name=default.name, kind=default.kind).first()
+        defaults = list(ManagedCredentialType.registry.values())
+        existing_map = {
+            (o['name'], o['kind']): o
+            for o in ct_class.objects.filter(name__in=[d.name for d in defaults]).values('pk', 'name', 'kind', 'namespace', 'inputs', 'injectors')
+        }
+        has_managed_field = 'managed' in [f.name for f in ct_class._meta.get_fields()]
+        to_update = {}
+        for default in defaults:
+            existing = existing_map.get((default.name, default.kind))
             if existing is not None:
-                existing.namespace = default.namespace
-                existing.inputs = {}
-                existing.injectors = {}
-                existing.save()
+                # only write the rows that are out of date
+                if (existing['namespace'], existing['inputs'], existing['injectors']) != (default.namespace, {}, {}):
+                    to_update[existing['pk']] = default
                 continue
             logger.debug(_("adding %s credential type" % default.name))
             params = default.get_creation_params()
-            if 'managed' not in [f.name for f in ct_class._meta.get_fields()]:
+            if not has_managed_field:
                 params['managed_by_tower'] = params.pop('managed')
             params['created'] = params['modified'] = now()  # CreatedModifiedModel service
             created = ct_class(**params)
             created.inputs = created.injectors = {}
             created.save()
+        for existing in ct_class.objects.filter(pk__in=to_update):
+            existing.namespace = to_update[existing.pk].namespace
+            existing.inputs = {}
+            existing.injectors = {}
+            existing.modified = now()  # CreatedModifiedModel service
+            existing.save(update_fields=['namespace', 'inputs', 'injectors', 'modified'])
 
     @classmethod
     def setup_tower_managed_defaults(cls, apps: Apps = None, app_config: AppConfig = None, lock: bool = True, wait_for_lock: bool = False):
@@ -513,7 +576,7 @@ class CredentialType(CommonModelNameNotUnique):
                                  files)
         """
         if not self.injectors:
-            if self.managed and credential.credential_type.namespace in dir(builtin_injectors):
+            if self.managed and credential.credential_type.namespace in _BUILTIN_INJECTOR_NAMES:
                 injected_env = {}
                 getattr(builtin_injectors, credential.credential_type.namespace)(credential, injected_env, private_data_dir)
                 env.update(injected_env)
@@ -534,8 +597,8 @@ class CredentialType(CommonModelNameNotUnique):
         # build a normal namespace with secret values decrypted (for
         # ansible-playbook) and a safe namespace with secret values hidden (for
         # DB storage)
-        injectable_fields = list(credential.inputs.keys()) + credential.dynamic_input_fields
-        for field_name in list(set(injectable_fields)):
+        injectable_fields = dict.fromkeys([*credential.inputs, *credential.dynamic_input_fields])
+        for field_name in injectable_fields:
             value = credential.get_input(field_name)
 
             if type(value) is bool:
@@ -543,12 +606,13 @@ class CredentialType(CommonModelNameNotUnique):
                 safe_namespace[field_name] = namespace[field_name] = value
                 continue
 
-            if field_name in self.secret_fields:
+            is_secret = field_name in self.secret_fields
+            if is_secret:
                 safe_namespace[field_name] = '**********'
-            elif len(value):
-                safe_namespace[field_name] = value
             if len(value):
                 namespace[field_name] = value
+                if not is_secret:
+                    safe_namespace[field_name] = value
 
         for field in self.inputs.get('fields', []):
             # default missing boolean fields to False
@@ -563,15 +627,13 @@ class CredentialType(CommonModelNameNotUnique):
         # If any file templates are provided, render the files and update the
         # special `tower` template namespace so the filename can be
         # referenced in other injectors
-
-        sandbox_env = sandbox.ImmutableSandboxedEnvironment()
-
-        for file_label, file_tmpl in file_tmpls.items():
-            data = sandbox_env.from_string(file_tmpl).render(**namespace)
-            _, path = tempfile.mkstemp(dir=os.path.join(private_data_dir, 'env'))
-            with open(path, 'w') as f:
+        compiled_file_tmpls = {file_label: _SANDBOX_ENV.from_string(file_tmpl) for file_label, file_tmpl in file_tmpls.items()}
+        for file_label, compiled_tmpl in compiled_file_tmpls.items():
+            data = compiled_tmpl.render(**namespace)
+            handle, path = tempfile.mkstemp(dir=os.path.join(private_data_dir, 'env'))
+            with os.fdopen(handle, 'w') as f:
                 f.write(data)
-            os.chmod(path, stat.S_IRUSR | stat.S_IWUSR)
+                os.fchmod(f.fileno(), stat.S_IRUSR | stat.S_IWUSR)
             container_path = to_container_path(path, private_data_dir)
 
             # determine if filename indicates single file or many
@@ -590,25 +652,34 @@ class CredentialType(CommonModelNameNotUnique):
             except ValidationError as e:
                 logger.error('Ignoring prohibited env var {}, reason: {}'.format(env_var, e))
                 continue
-            env[env_var] = sandbox_env.from_string(tmpl).render(**namespace)
-            safe_env[env_var] = sandbox_env.from_string(tmpl).render(**safe_namespace)
+            compiled_tmpl = _SANDBOX_ENV.from_string(tmpl)
+            env[env_var] = compiled_tmpl.render(**namespace)
+            safe_env[env_var] = compiled_tmpl.render(**safe_namespace)
 
         if 'INVENTORY_UPDATE_ID' not in env:
             # awx-manage inventory_update does not support extra_vars via -e
+            compiled_tmpls = {}
+
             def build_extra_vars(node):
                 if isinstance(node, dict):
                     return {build_extra_vars(k): build_extra_vars(v) for k, v in node.items()}
                 elif isinstance(node, list):
                     return [build_extra_vars(x) for x in node]
                 else:
-                    return sandbox_env.from_string(node).render(**namespace)
+                    # literals render unchanged, unless Jinja would normalize their newlines
+                    if isinstance(node, str) and '{' not in node and '\r' not in node and not node.endswith('\n'):
+                        return node
+                    # key on the type too, so that e.g. 1, True and 1.0 don't share an entry
+                    key = (type(node), node)
+                    if key not in compiled_tmpls:
+                        compiled_tmpls[key] = _SANDBOX_ENV.from_string(node)
+                    return compiled_tmpls[key].render(**namespace)
 
             def build_extra_vars_file(vars, private_dir):
                 handle, path = tempfile.mkstemp(dir=os.path.join(private_dir, 'env'))
-                f = os.fdopen(handle, 'w')
-                f.write(safe_dump(vars))
-                f.close()
-                os.chmod(path, stat.S_IRUSR)
+                with os.fdopen(handle, 'w') as f:
+                    f.write(safe_dump(vars))
+                    os.fchmod(f.fileno(), stat.S_IRUSR)
                 return path
 
             extra_vars = build_extra_vars(self.injectors.get('extra_vars', {}))
@@ -618,6 +689,16 @@ class CredentialType(CommonModelNameNotUnique):
                 args.extend(['-e', '@%s' % container_path])
 
 
+_defaults_cache = None
+
+
+def _get_defaults():
+    global _defaults_cache
+    if _defaults_cache is None:
+        _defaults_cache = MappingProxyType({k: v.create for k, v in ManagedCredentialType.registry.items()})
+    return _defaults_cache
+
+
 class ManagedCredentialType(SimpleNamespace):
     registry = {}
 
@@ -633,6 +714,8 @@ class ManagedCredentialType(SimpleNamespace):
                 )
             )
         ManagedCredentialType.registry[namespace] = self
+        global _defaults_cache
+        _defaults_cache = None
 
     def get_creation_params(self):
         return dict(
@@ -695,12 +778,11 @@ class CredentialInputSource(PrimordialModel):
 
     def get_input_value(self):
         backend = self.source_credential.credential_type.plugin.backend
-        backend_kwargs = {}
-        for field_name, value in self.source_credential.inputs.items():
-            if field_name in self.source_credential.credential_type.secret_fields:
-                backend_kwargs[field_name] = decrypt_field(self.source_credential, field_name)
-            else:
-                backend_kwargs[field_name] = value
+        backend_kwargs = dict(self.source_credential.inputs)
+        secret_fields = self.source_credential.credential_type.secret_fields
+        secret_names = [field_name for field_name in backend_kwargs if field_name in secret_fields]
+        if secret_names:
+            backend_kwargs.update(decrypt_fields(self.source_credential, secret_names))
 
         backend_kwargs.update(self.metadata)
 
@@ -714,5 +796,6 @@ class CredentialInputSource(PrimordialModel):
 
 from awx_plugins.credentials.plugins import *  # noqa
 
-for ns, plugin in credential_plugins.items():
-    CredentialType.load_plugin(ns, plugin)
+for ns in credential_plugin_entry_points:
+    # registration needs the plugin's name and inputs, so this loads every plugin module
+    CredentialType.load_plugin(ns, get_credential_plugin(ns))
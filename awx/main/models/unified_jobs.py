@@ -1370,7 +1370,7 @@ class UnifiedJob(
 
         # verify that any associated credentials aren't missing required field data
         missing_credential_inputs = []
-        for credential in self.credentials.all():
+        for credential in self.credentials.select_related('credential_type'):
             defined_fields = credential.credential_type.defined_fields
             for required in credential.credential_type.inputs.get('required', []):
                 if required in defined_fields and not credential.has_input(required):
@@ -17,6 +17,7 @@ import urllib.parse as urlparse
 
 # Django
 from django.conf import settings
+from django.db.models import Prefetch
 
 
 # Runner
@@ -53,6 +54,7 @@ from awx.main.models import (
     InventoryUpdateEvent,
     AdHocCommandEvent,
     SystemJobEvent,
+    CredentialInputSource,
     build_safe_env,
 )
 from awx.main.tasks.callback import (
@@ -106,6 +108,17 @@ def with_path_cleanup(f):
     return _wrapped
 
 
+def with_input_sources(credentials):
+    """
+    Join the credential type of the given credentials and prefetch their
+    input sources (and the source credential types needed to resolve them)
+    so that neither issues a query per credential or per dynamic field.
+    """
+    return credentials.select_related('credential_type').prefetch_related(
+        Prefetch('input_sources', queryset=CredentialInputSource.objects.select_related('source_credential__credential_type'))
+    )
+
+
 class BaseTask(object):
     model = None
     event_model = None
@@ -833,7 +846,7 @@ class RunJob(SourceControlMixin, BaseTask):
         }
         """
         private_data = {'credentials': {}}
-        for credential in job.credentials.prefetch_related('input_sources__source_credential').all():
+        for credential in with_input_sources(job.credentials).all():
             # If we were sent SSH credentials, decrypt them and send them
             # back (they will be written to a temporary file).
             if credential.has_input('ssh_key_data'):
@@ -1042,7 +1055,7 @@ class RunJob(SourceControlMixin, BaseTask):
         return self._write_extra_vars_file(private_data_dir, extra_vars, safe_dict)
 
     def build_credentials_list(self, job):
-        return job.credentials.prefetch_related('input_sources__source_credential').all()
+        return with_input_sources(job.credentials).all()
 
     def get_password_prompts(self, passwords={}):
         d = super(RunJob, self).get_password_prompts(passwords)
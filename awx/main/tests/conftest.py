@@ -184,7 +184,7 @@ def mock_external_credential_input_sources():
     # Credential objects query their related input sources on initialization.
     # We mock that behavior out of credentials by default unless we need to
     # test it explicitly.
-    with mock.patch.object(Credential, 'dynamic_input_fields', new=[]) as _fixture:
+    with mock.patch.object(Credential, 'dynamic_input_fields', new=frozenset()) as _fixture:
         yield _fixture
 
 
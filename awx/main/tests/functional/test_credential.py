@@ -1,11 +1,16 @@
 # Copyright (c) 2017 Ansible by Red Hat
 # All Rights Reserved.
 
+from unittest import mock
+
 import pytest
 from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from awx.main.utils import decrypt_field
-from awx.main.models import Credential, CredentialType
+from awx.main.models import Credential, CredentialInputSource, CredentialType, ManagedCredentialType
+from awx.main.tasks.jobs import with_input_sources
 
 from rest_framework import serializers
 
@@ -288,6 +293,21 @@ def test_credential_update_with_prior(organization_factory, credentialtype_ssh):
     assert decrypt_field(cred, 'password') == 'testing123'
 
 
+@pytest.mark.django_db
+@pytest.mark.parametrize('password, expect_lookup', [('$encrypted$', True), ('new-secret', False)])
+def test_credential_update_prior_lookup(credentialtype_ssh, password, expect_lookup):
+    cred = Credential.objects.create(credential_type=credentialtype_ssh, name='machine-cred', inputs={'username': 'joe', 'password': 'testing123'})
+    cred = Credential.objects.get(pk=cred.pk)
+    cred.inputs['password'] = password
+    with CaptureQueriesContext(connection) as ctx:
+        cred.save()
+
+    prior_lookup = 'SELECT "main_credential"."inputs" FROM "main_credential"'
+    assert any(q['sql'].startswith(prior_lookup) for q in ctx.captured_queries) is expect_lookup
+    cred = Credential.objects.get(pk=cred.pk)
+    assert decrypt_field(cred, 'password') == ('testing123' if expect_lookup else 'new-secret')
+
+
 @pytest.mark.django_db
 def test_credential_get_input(organization_factory):
     organization = organization_factory('test').organization
@@ -341,6 +361,13 @@ def test_credential_get_input(organization_factory):
     assert cred.get_input('vault_password') == 'testing321'
 
 
+@pytest.mark.django_db
+def test_credential_with_type(credential, django_assert_num_queries):
+    with django_assert_num_queries(1):
+        cred = Credential.with_type().get(pk=credential.pk)
+        assert cred.cloud is True
+
+
 @pytest.mark.django_db
 def test_idempotent_credential_type_setup():
     """
@@ -361,3 +388,46 @@ def test_idempotent_credential_type_setup():
 
     CredentialType.setup_tower_managed_defaults()
     assert CredentialType.objects.count() == total
+
+
+@pytest.mark.django_db
+def test_credential_type_setup_fixes_out_of_date_rows():
+    CredentialType.setup_tower_managed_defaults()
+    ssh = ManagedCredentialType.registry['ssh']
+    stale = CredentialType.objects.filter(name=ssh.name, kind=ssh.kind)
+    stale.update(namespace=None, inputs={'fields': [{'id': 'foo', 'label': 'Foo'}]})
+    modified_before = stale.values_list('modified', flat=True).get()
+
+    CredentialType.setup_tower_managed_defaults()
+    row = stale.values('namespace', 'inputs', 'injectors', 'modified').get()
+    assert row.pop('modified') > modified_before
+    assert row == {'namespace': 'ssh', 'inputs': {}, 'injectors': {}}
+
+
+@pytest.mark.django_db
+def test_credential_type_setup_skips_up_to_date_rows(django_assert_num_queries):
+    CredentialType.setup_tower_managed_defaults()
+    # a single SELECT of the existing rows, and no UPDATE or INSERT
+    with django_assert_num_queries(1):
+        CredentialType.setup_tower_managed_defaults(lock=False)
+
+
+@pytest.mark.django_db
+def test_credential_dynamic_inputs_with_input_sources(machine_credential, external_credential, django_assert_num_queries):
+    # the session-wide fixture stubs out dynamic_input_fields; compute it from the prefetched sources here
+    dynamic_input_fields = property(lambda self: frozenset(src.input_field_name for src in self._input_sources_list))
+    for field_name in ('username', 'password'):
+        CredentialInputSource.objects.create(
+            target_credential=machine_credential, source_credential=external_credential, input_field_name=field_name, metadata={'key': field_name}
+        )
+
+    with mock.patch.object(Credential, 'dynamic_input_fields', new=dynamic_input_fields):
+        with django_assert_num_queries(2):
+            cred = with_input_sources(Credential.objects.filter(pk=machine_credential.pk)).get()
+            assert sorted(src.input_field_name for src in cred._input_sources_list) == ['password', 'username']
+            assert cred.get_input('username') == 'secret'
+            assert cred.get_input('password') == 'secret'
+
+        CredentialInputSource.objects.filter(target_credential=machine_credential, input_field_name='password').delete()
+        cred.refresh_from_db()
+        assert [src.input_field_name for src in cred._input_sources_list] == ['username']
@@ -2,6 +2,8 @@
 
 # Copyright (c) 2017 Ansible, Inc.
 # All Rights Reserved.
+from unittest import mock
+
 import pytest
 
 from awx.conf.models import Setting
@@ -37,6 +39,14 @@ def test_encrypt_subfield():
     assert encrypted.startswith('$encrypted$UTF8$AESCBC$')
 
 
+def test_decrypt_fields():
+    credential = mock.Mock(spec_set=['pk', 'inputs'], pk=123, inputs={'username': 'bob', 'password': 'secret', 'token': 'ANSIBLE'})
+    for field_name in ('password', 'token'):
+        credential.inputs[field_name] = encryption.encrypt_field(credential, field_name)
+    assert credential.inputs['password'].startswith('$encrypted$')
+    assert encryption.decrypt_fields(credential, ['username', 'password', 'token']) == {'username': 'bob', 'password': 'secret', 'token': 'ANSIBLE'}
+
+
 def test_encrypt_field_with_ask():
     encrypted = encryption.encrypt_field(Setting(value='ASK'), 'value', ask=True)
     assert encrypted == 'ASK'
@@ -7,6 +7,7 @@ from awx.main.utils.encryption import (  # noqa
     get_encryption_key,
     encrypt_field,
     decrypt_field,
+    decrypt_fields,
     encrypt_value,
     decrypt_value,
     encrypt_dict,
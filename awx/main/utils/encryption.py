@@ -10,7 +10,7 @@ from cryptography.hazmat.backends import default_backend
 from django.utils.encoding import smart_str, smart_bytes
 
 
-__all__ = ['get_encryption_key', 'encrypt_field', 'decrypt_field', 'encrypt_value', 'decrypt_value', 'encrypt_dict']
+__all__ = ['get_encryption_key', 'encrypt_field', 'decrypt_field', 'decrypt_fields', 'encrypt_value', 'decrypt_value', 'encrypt_dict']
 
 logger = logging.getLogger('awx.main.utils.encryption')
 
@@ -42,12 +42,25 @@ def get_encryption_key(field_name, pk=None, secret_key=None):
                can be omitted in situations where you're encrypting a setting
                that is not database-persistent (like a read-only setting)
     """
+    return _derive_encryption_key(_encryption_key_hash(pk, secret_key), field_name)
+
+
+def _encryption_key_hash(pk=None, secret_key=None):
+    """
+    Return the partial key hash shared by every field of a model object,
+    to be completed with a field name by ``_derive_encryption_key``.
+    """
     from django.conf import settings
 
     h = hashlib.sha512()
     h.update(smart_bytes(secret_key or settings.SECRET_KEY))
     if pk is not None:
         h.update(smart_bytes(str(pk)))
+    return h
+
+
+def _derive_encryption_key(key_hash, field_name):
+    h = key_hash.copy()
     h.update(smart_bytes(field_name))
     return base64.urlsafe_b64encode(h.digest())
 
@@ -141,6 +154,22 @@ def decrypt_field(instance, field_name, subfield=None, secret_key=None):
     """
     Return content of the given instance and field name decrypted.
     """
+    return _decrypt_field(instance, field_name, subfield=subfield, secret_key=secret_key)
+
+
+def decrypt_fields(instance, field_names, secret_key=None):
+    """
+    Return a dict of the given field names mapped to the decrypted content of
+    those fields on the given instance.
+
+    The part of the key derivation that does not depend on the field name
+    (``settings.SECRET_KEY`` and the instance pk) is only computed once.
+    """
+    key_hash = _encryption_key_hash(getattr(instance, 'pk', None), secret_key)
+    return dict((field_name, _decrypt_field(instance, field_name, key_hash=key_hash)) for field_name in field_names)
+
+
+def _decrypt_field(instance, field_name, subfield=None, secret_key=None, key_hash=None):
     try:
         value = instance.inputs[field_name]
     except (TypeError, AttributeError):
@@ -153,7 +182,9 @@ def decrypt_field(instance, field_name, subfield=None, secret_key=None):
     value = smart_str(value)
     if not value or not value.startswith('$encrypted$'):
         return value
-    key = get_encryption_key(field_name, getattr(instance, 'pk', None), secret_key=secret_key)
+    if key_hash is None:
+        key_hash = _encryption_key_hash(getattr(instance, 'pk', None), secret_key)
+    key = _derive_encryption_key(key_hash, field_name)
 
     try:
         return smart_str(decrypt_value(key, value))